@@ -6,11 +6,16 @@ Automatically detects all available channels and downloads videos from each.
 """
 
 import os
+import re
 import sys
+import json
+import time
+import functools
 import argparse
+import tempfile
 import threading
-from datetime import timedelta
-from queue import Queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta, timezone
 
 # Import from the main script
 from media_download import (
@@ -35,12 +40,39 @@ from src.log_wrapper import logging_wrapper
 from src.log_printer import LogPrinter
 from src.utils import *
 from src.track import Track
+from src.token_bucket import TokenBucket
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # ====== Multi-channel Parameters ======
 MAX_CONCURRENT_DOWNLOADS = 3  # Maximum number of channels to download from simultaneously
 MAX_CHANNEL_TO_SCAN = 32  # Maximum channel number to scan (most NVRs have 4, 8, 16, or 32 channels)
+MAX_CONCURRENT_CHANNEL_PROBES = 16  # Maximum number of channels to probe simultaneously while scanning
+MAX_EMPTY_CHANNELS_GAP = 0  # Scanning stops after this many consecutive empty channels following a found one, 0 to scan all
+MAX_TRACK_SEARCH_INTERVALS = 8  # Maximum number of parts the time range of a channel is split into for searching
+MAX_CONCURRENT_TRACK_SEARCHES = 4  # Maximum number of parts of a channel searched simultaneously
+RANGED_DOWNLOAD_MIN_SIZE_BYTES = 32 * 1024 * 1024  # Videos larger than this are downloaded in parallel byte ranges
+RANGED_DOWNLOAD_PARTS = 4  # Number of byte ranges a large video is downloaded in
+CHANNEL_MAPPING_FILE = 'channel_mapping.json'  # Channel scan results cache, stored in the media archive
+CHANNEL_SCAN_CACHE_SECONDS = 24 * 60 * 60  # How long cached channel scan results are reused
 # ======================================
 
+# Single channel "3" or channel range "1-4", surrounding whitespace allowed
+CHANNEL_RANGE_PATTERN = re.compile(r'\s*(\d+)(?:\s*-\s*(\d+))?\s*')
+
+# Absolute path of the media archive, every downloaded file must be inside it
+BASE_ARCHIVE_PATH = os.path.abspath(path_to_media_archive)
+
+# Highest channel number reported by each NVR, queried once per run
+_max_channel_numbers = {}
+
+# Download rate limiter of each NVR, shared by all its channels
+_download_rate_limiters = {}
+_download_rate_limiters_lock = threading.Lock()
+
 
 def get_path_to_video_archive(nvr_ip: str, channel_num: int = None):
     """Get the path for video archive, optionally including channel subdirectory."""
@@ -50,7 +82,148 @@ def get_path_to_video_archive(nvr_ip: str, channel_num: int = None):
     return base_path + '/'
 
 
-def get_available_channels(auth_handler, nvr_ip, utc_time_interval, content_type, max_channel=MAX_CHANNEL_TO_SCAN):
+@functools.lru_cache(maxsize=128)
+def _fmt_channel(channel_num):
+    """Channel label used in progress messages and logs."""
+    return f'Channel {channel_num:02d}'
+
+
+def get_path_to_channel_mapping():
+    return path_to_media_archive + CHANNEL_MAPPING_FILE
+
+
+@functools.lru_cache(maxsize=32)
+def _load_channel_mapping_cached(mapping_file, mtime_ns):
+    """Read the mapping file, cached by its modification time so the file is parsed once per change."""
+    try:
+        with open(mapping_file, 'rb') as f:
+            mapping_data = f.read()
+        return orjson.loads(mapping_data) if orjson else json.loads(mapping_data)
+    except (OSError, ValueError) as e:
+        Logger.get_logger().error(f'Failed to load channel mapping {mapping_file}: {e}')
+        return {}
+
+
+def load_channel_mapping():
+    """Load cached channel scan results of all NVRs, keyed by NVR IP. The result must not be modified."""
+    mapping_file = get_path_to_channel_mapping()
+    try:
+        mtime_ns = os.stat(mapping_file).st_mtime_ns
+    except OSError:
+        return {}
+    
+    return _load_channel_mapping_cached(mapping_file, mtime_ns)
+
+
+def save_channel_mapping(nvr_ip, scan_result):
+    """Store channel scan results of the NVR, replacing the mapping file atomically. Failures are only logged."""
+    mapping_file = get_path_to_channel_mapping()
+    mapping = dict(load_channel_mapping())
+    mapping[nvr_ip] = scan_result
+    
+    if orjson:
+        mapping_data = orjson.dumps(mapping, option=orjson.OPT_INDENT_2)
+    else:
+        mapping_data = json.dumps(mapping, indent=2).encode('utf-8')
+    
+    temp_file = None
+    try:
+        create_directory_for(mapping_file)
+        # A unique temporary file keeps concurrent runs from writing into each other's data
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(mapping_file), prefix=CHANNEL_MAPPING_FILE + '.',
+                                         suffix='.tmp', delete=False) as f:
+            temp_file = f.name
+            f.write(mapping_data)
+        os.replace(temp_file, mapping_file)
+    except OSError as e:
+        Logger.get_logger().error(f'Failed to save channel mapping {mapping_file}: {e}')
+        if temp_file and os.path.exists(temp_file):
+            os.remove(temp_file)
+        return
+    _load_channel_mapping_cached.cache_clear()
+
+
+def get_channel_scan_parameters(utc_time_interval, content_type, max_channel):
+    """Parameters a channel scan result depends on, cached results are only reused when they match."""
+    return {
+        'time_interval': list(utc_time_interval.to_text()),
+        'content_type': content_type,
+        'max_channel': max_channel
+    }
+
+
+def get_cached_channels(nvr_ip, scan_parameters):
+    """Get channels found by a recent scan with the same parameters, or None."""
+    scan_result = load_channel_mapping().get(nvr_ip)
+    if not scan_result or scan_result.get('parameters') != scan_parameters:
+        return None
+    scanned_at = scan_result.get('scanned_at', 0)
+    if time.time() - scanned_at >= CHANNEL_SCAN_CACHE_SECONDS:
+        return None
+    # Channels may start recording after a scan of an interval that hadn't ended yet
+    utc_end_time = TimeInterval.from_string(*scan_parameters['time_interval']).end_time
+    if utc_end_time.replace(tzinfo=timezone.utc).timestamp() > scanned_at:
+        return None
+    return scan_result.get('channels')
+
+
+def get_download_rate_limiter(nvr_ip, max_concurrent):
+    """Get the token bucket limiting how often downloads from the NVR start, or None if unlimited."""
+    if DELAY_BETWEEN_DOWNLOADING_FILES_SECONDS <= 0:
+        return None
+    
+    # The NVR may start as many downloads per delay as there are concurrent channels,
+    # the same total rate a fixed delay per channel allowed
+    with _download_rate_limiters_lock:
+        if nvr_ip not in _download_rate_limiters:
+            _download_rate_limiters[nvr_ip] = TokenBucket(max_concurrent / DELAY_BETWEEN_DOWNLOADING_FILES_SECONDS, max_concurrent)
+        return _download_rate_limiters[nvr_ip]
+
+
+def get_max_channel_number(auth_handler, nvr_ip):
+    """Get the highest channel number the NVR reports, or None if it can't be determined."""
+    if nvr_ip not in _max_channel_numbers:
+        try:
+            _max_channel_numbers[nvr_ip] = CameraSdk.get_max_channel_number(auth_handler, nvr_ip)
+        except Exception as e:
+            Logger.get_logger().error(f'Failed to get channel list of NVR {nvr_ip}: {e}')
+            _max_channel_numbers[nvr_ip] = None
+    return _max_channel_numbers[nvr_ip]
+
+
+def channel_has_recordings(auth_handler, nvr_ip, channel_num, utc_time_interval, content_type):
+    """Check whether a single channel has any recorded media in the time interval."""
+    # Determine track ID base (101 for video, 103 for photo)
+    if content_type == ContentType.VIDEO:
+        track_id_base = 101
+    else:
+        track_id_base = 103
+    
+    # Calculate track ID: channel 1 = 101, channel 2 = 201, etc.
+    track_id = (channel_num * 100) + (track_id_base % 100)
+    
+    try:
+        # Try to get tracks for this channel
+        answer = CameraSdk.get_tracks_info(
+            auth_handler, 
+            nvr_ip, 
+            utc_time_interval, 
+            1,  # Only need to check if any tracks exist
+            track_id
+        )
+        
+        if answer and answer.ok:
+            return CameraSdk.has_tracks(answer)
+        
+    except Exception as e:
+        # Channel likely doesn't exist or has no recordings
+        pass
+    
+    return False
+
+
+def get_available_channels(auth_handler, nvr_ip, utc_time_interval, content_type, max_channel=MAX_CHANNEL_TO_SCAN,
+                           max_gap=MAX_EMPTY_CHANNELS_GAP):
     """
     Scan NVR to find all channels that have recorded media.
     
@@ -60,53 +233,87 @@ def get_available_channels(auth_handler, nvr_ip, utc_time_interval, content_type
         utc_time_interval: Time interval to check for recordings
         content_type: Type of content (VIDEO or PHOTO)
         max_channel: Maximum channel number to scan
+        max_gap: Number of consecutive empty channels after a found one that ends the scan, 0 to scan all.
+                 Only used when the NVR doesn't report how many channels it has
     
     Returns:
         List of channel numbers that have recordings
     """
-    available_channels = []
+    # Don't probe channels the device doesn't have
+    reported_max_channel = get_max_channel_number(auth_handler, nvr_ip)
+    if reported_max_channel:
+        max_channel = min(max_channel, reported_max_channel)
+        # Every channel in the range exists, an empty one merely has no recordings in this interval
+        max_gap = 0
     
     print(f"\nScanning NVR {nvr_ip} for available channels...")
     print(f"(This may take a moment, checking channels 1-{max_channel})")
     
-    # Determine track ID base (101 for video, 103 for photo)
-    if content_type == ContentType.VIDEO:
-        track_id_base = 101
-    else:
-        track_id_base = 103
+    # Probe channels concurrently in batches, the scan is bound by network round trips.
+    # Results are consumed in channel order, so progress is printed as soon as it is known.
+    # Without the channel count from the device, a long run of empty channels after a found one
+    # is taken to mean the rest of the range doesn't exist, channels are usually numbered from 1 without holes.
+    available_channels = []
+    consecutive_empty = 0
+    batch_size = max(max_gap, MAX_CONCURRENT_CHANNEL_PROBES)
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CHANNEL_PROBES) as executor:
+        for batch_start in range(1, max_channel + 1, batch_size):
+            channel_numbers = range(batch_start, min(batch_start + batch_size, max_channel + 1))
+            probe_results = executor.map(
+                lambda channel_num: channel_has_recordings(auth_handler, nvr_ip, channel_num, utc_time_interval, content_type),
+                channel_numbers
+            )
+            for channel_num, has_recordings in zip(channel_numbers, probe_results):
+                if has_recordings:
+                    available_channels.append(channel_num)
+                    consecutive_empty = 0
+                    print(f"  ✓ {_fmt_channel(channel_num)} has recordings")
+                else:
+                    consecutive_empty += 1
+
+            if max_gap and available_channels and consecutive_empty >= max_gap:
+                break
     
-    for channel_num in range(1, max_channel + 1):
-        # Calculate track ID: channel 1 = 101, channel 2 = 201, etc.
-        track_id = (channel_num * 100) + (track_id_base % 100)
-        
+    print(f"\nFound {len(available_channels)} channel(s) with recordings: {available_channels}\n")
+    return available_channels
+
+
+def get_tracks_in_interval(auth_handler, nvr_ip, channel_num, track_id, search_interval):
+    """Get all tracks of a channel within the interval, paging through the search results."""
+    logger = Logger.get_logger()
+    local_time_offset = search_interval.local_time_offset
+    
+    tracks = []
+    while True:
         try:
-            # Try to get tracks for this channel
             answer = CameraSdk.get_tracks_info(
-                auth_handler, 
-                nvr_ip, 
-                utc_time_interval, 
-                1,  # Only need to check if any tracks exist
+                auth_handler,
+                nvr_ip,
+                search_interval,
+                MAX_NUMBER_OF_FILES_IN_ONE_REQUEST,
                 track_id
             )
             
             if answer and answer.ok:
-                # Parse response to check if there are any tracks
-                local_time_offset = utc_time_interval.local_time_offset
-                tracks = CameraSdk.create_tracks_from_info(answer, local_time_offset)
+                new_tracks = CameraSdk.create_tracks_from_info(answer, local_time_offset)
+                tracks.extend(new_tracks)
+                
+                if len(new_tracks) < MAX_NUMBER_OF_FILES_IN_ONE_REQUEST:
+                    break
+                
+                # Move to next batch, the interval is advanced in place
+                search_interval.start_time = new_tracks[-1].get_time_interval().end_time
+            else:
+                break
                 
-                if len(tracks) > 0:
-                    available_channels.append(channel_num)
-                    print(f"  ✓ Channel {channel_num:02d} has recordings")
-            
         except Exception as e:
-            # Channel likely doesn't exist or has no recordings
-            pass
+            logger.error(f'{_fmt_channel(channel_num)}: Error getting tracks: {e}')
+            break
     
-    print(f"\nFound {len(available_channels)} channel(s) with recordings: {available_channels}\n")
-    return available_channels
+    return tracks
 
 
-def download_channel_media(auth_handler, nvr_ip, channel_num, utc_time_interval, content_type):
+def download_channel_media(auth_handler, nvr_ip, channel_num, utc_time_interval, content_type, rate_limiter=None):
     """
     Download media from a specific channel.
     
@@ -116,6 +323,7 @@ def download_channel_media(auth_handler, nvr_ip, channel_num, utc_time_interval,
         channel_num: Channel number (1-32)
         utc_time_interval: Time interval to download
         content_type: Type of content (VIDEO or PHOTO)
+        rate_limiter: Token bucket shared by all channels of the NVR, or None to download without delays
     
     Returns:
         Number of files downloaded
@@ -128,114 +336,105 @@ def download_channel_media(auth_handler, nvr_ip, channel_num, utc_time_interval,
     else:
         track_id = (channel_num * 100) + 3
     
-    logger.info(f'Channel {channel_num:02d}: Getting track list...')
+    logger.info(f'{_fmt_channel(channel_num)}: Getting track list...')
     
-    # Get all tracks for this channel
-    tracks = []
-    search_interval = TimeInterval(
-        utc_time_interval.start_time,
-        utc_time_interval.end_time,
-        utc_time_interval.local_time_offset
-    )
+    # Split the range up-front and search the parts concurrently instead of paging serially
+    search_range_hours = int((utc_time_interval.end_time - utc_time_interval.start_time).total_seconds() // 3600)
+    search_intervals = utc_time_interval.split(max(1, min(MAX_TRACK_SEARCH_INTERVALS, search_range_hours)))
     
-    while True:
-        try:
-            answer = CameraSdk.get_tracks_info(
-                auth_handler,
-                nvr_ip,
-                search_interval,
-                MAX_NUMBER_OF_FILES_IN_ONE_REQUEST,
-                track_id
-            )
-            
-            if answer and answer.ok:
-                local_time_offset = search_interval.local_time_offset
-                new_tracks = CameraSdk.create_tracks_from_info(answer, local_time_offset)
-                tracks += new_tracks
-                
-                if len(new_tracks) < MAX_NUMBER_OF_FILES_IN_ONE_REQUEST:
-                    break
-                
-                # Move to next batch
-                last_track = tracks[-1]
-                search_interval.start_time = last_track.get_time_interval().end_time
-            else:
-                break
-                
-        except Exception as e:
-            logger.error(f'Channel {channel_num:02d}: Error getting tracks: {e}')
-            break
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_TRACK_SEARCHES) as executor:
+        track_batches = list(executor.map(
+            lambda search_interval: get_tracks_in_interval(auth_handler, nvr_ip, channel_num, track_id, search_interval),
+            search_intervals
+        ))
+    
+    # Tracks crossing a boundary between the parts are found by both searches
+    unique_tracks = {}
+    for track_batch in track_batches:
+        for track in track_batch:
+            unique_tracks.setdefault(track.url_to_download(), track)
+    tracks = sorted(unique_tracks.values(), key=lambda track: track.get_time_interval().start_time)
+    
+    logger.info(f'{_fmt_channel(channel_num)}: Found {len(tracks)} files')
     
-    logger.info(f'Channel {channel_num:02d}: Found {len(tracks)} files')
+    # Prepare the channel directory once instead of for every file
+    channel_dir = get_path_to_video_archive(nvr_ip, channel_num)
+    os.makedirs(channel_dir, exist_ok=True)
     
-    # Download all tracks
+    # Download all tracks, the request rate is limited per NVR rather than per channel
     downloaded_count = 0
     for track in tracks:
         while True:
-            if download_file_with_retry(auth_handler, nvr_ip, channel_num, track, content_type):
+            if rate_limiter:
+                rate_limiter.acquire()
+            if download_file_with_retry(auth_handler, nvr_ip, channel_num, track, content_type, channel_dir):
                 downloaded_count += 1
                 break
             else:
-                import time
                 time.sleep(DELAY_AFTER_TIMEOUT_SECONDS)
-        
-        import time
-        time.sleep(DELAY_BETWEEN_DOWNLOADING_FILES_SECONDS)
     
     return downloaded_count
 
 
-def download_file_with_retry(auth_handler, nvr_ip, channel_num, track, content_type):
-    """Download a single file with retry logic."""
+def download_file_with_retry(auth_handler, nvr_ip, channel_num, track, content_type, channel_dir):
+    """Download a single file with retry logic. The channel directory must already exist."""
     logger = Logger.get_logger()
     
     start_time_text = track.get_time_interval().to_local_time().to_filename_text()
     sanitized_time_text = sanitize_filename(start_time_text)
-    file_name = get_path_to_video_archive(nvr_ip, channel_num) + sanitized_time_text + '.' + content_type
+    file_name = channel_dir + sanitized_time_text + '.' + content_type
     url_to_download = track.url_to_download()
     
     # Validate the file path
-    base_archive_path = os.path.abspath(path_to_media_archive)
-    if not validate_path(file_name, base_archive_path):
-        logger.error(f'Channel {channel_num:02d}: Invalid file path detected: {file_name}')
+    if not validate_path(file_name, BASE_ARCHIVE_PATH):
+        logger.error(f'{_fmt_channel(channel_num)}: Invalid file path detected: {file_name}')
         return False
     
-    create_directory_for(file_name)
-    
-    logger.info(f'Channel {channel_num:02d}: Downloading {os.path.basename(file_name)}')
+    logger.info(f'{_fmt_channel(channel_num)}: Downloading {os.path.basename(file_name)}')
     
-    status = CameraSdk.download_file(auth_handler, nvr_ip, url_to_download, file_name)
+    track_size = str(track.size())
+    if content_type == ContentType.VIDEO and track_size.isdigit() and int(track_size) > RANGED_DOWNLOAD_MIN_SIZE_BYTES:
+        status = CameraSdk.download_file_in_parts(auth_handler, nvr_ip, url_to_download, file_name, RANGED_DOWNLOAD_PARTS)
+    else:
+        status = CameraSdk.download_file(auth_handler, nvr_ip, url_to_download, file_name)
     
     if status.result_type == CameraSdk.FileDownloadingResult.OK:
         return True
     else:
         if status.result_type == CameraSdk.FileDownloadingResult.TIMEOUT:
-            logger.error(f"Channel {channel_num:02d}: Timeout during file downloading")
+            logger.error(f"{_fmt_channel(channel_num)}: Timeout during file downloading")
         elif status.result_type == CameraSdk.FileDownloadingResult.DEVICE_ERROR:
-            logger.error(f"Channel {channel_num:02d}: Device error - {status.text}")
+            logger.error(f"{_fmt_channel(channel_num)}: Device error - {status.text}")
             # Note: We don't reboot for multi-channel downloads as it would affect all channels
         else:
-            logger.error(f"Channel {channel_num:02d}: {status.text}")
+            logger.error(f"{_fmt_channel(channel_num)}: {status.text}")
         return False
 
 
-def download_from_channel_worker(auth_handler, nvr_ip, channel_num, utc_time_interval, content_type, results_queue):
-    """Worker function for downloading from a single channel in a thread."""
+def download_from_channel_worker(auth_handler, nvr_ip, channel_num, utc_time_interval, content_type, rate_limiter):
+    """
+    Worker function for downloading from a single channel in a thread pool.
+    
+    Returns:
+        Tuple (channel_num, success, count, error)
+    """
+    print(f"Starting download from channel {channel_num:02d}...")
     try:
         # Initialize logger for this channel
         log_file_name = base_path_to_log_file + f'{nvr_ip}_channel_{channel_num:02d}.log'
         create_directory_for(log_file_name)
         
-        count = download_channel_media(auth_handler, nvr_ip, channel_num, utc_time_interval, content_type)
-        results_queue.put((channel_num, True, count, None))
-        print(f"✓ Channel {channel_num:02d}: Successfully downloaded {count} files")
+        count = download_channel_media(auth_handler, nvr_ip, channel_num, utc_time_interval, content_type, rate_limiter)
+        print(f"✓ {_fmt_channel(channel_num)}: Successfully downloaded {count} files")
+        return channel_num, True, count, None
     except Exception as e:
-        results_queue.put((channel_num, False, 0, str(e)))
-        print(f"✗ Channel {channel_num:02d}: Failed - {e}")
+        print(f"✗ {_fmt_channel(channel_num)}: Failed - {e}")
+        return channel_num, False, 0, str(e)
 
 
 def download_from_all_channels(nvr_ip, start_datetime_str, end_datetime_str, use_utc_time, content_type, 
-                                max_concurrent, max_channel, specific_channels=None):
+                                max_concurrent, max_channel, specific_channels=None, rescan=False,
+                                max_gap=MAX_EMPTY_CHANNELS_GAP):
     """
     Download media from all available channels of an NVR.
     
@@ -248,6 +447,8 @@ def download_from_all_channels(nvr_ip, start_datetime_str, end_datetime_str, use
         max_concurrent: Maximum number of concurrent downloads
         max_channel: Maximum channel number to scan
         specific_channels: List of specific channel numbers to download (None = auto-detect)
+        rescan: Whether to scan channels even if a recent scan result is cached
+        max_gap: Number of consecutive empty channels after a found one that ends the scan, 0 to scan all
     """
     logger = Logger.get_logger()
     
@@ -274,7 +475,20 @@ def download_from_all_channels(nvr_ip, start_datetime_str, end_datetime_str, use
             channels = specific_channels
             print(f"\nDownloading from specified channels: {channels}")
         else:
-            channels = get_available_channels(auth_handler, nvr_ip, utc_time_interval, content_type, max_channel)
+            scan_parameters = get_channel_scan_parameters(utc_time_interval, content_type, max_channel)
+            channels = None if rescan else get_cached_channels(nvr_ip, scan_parameters)
+            if channels:
+                print(f"\nUsing channels found by previous scan: {channels} (use --rescan to scan again)")
+            else:
+                channels = get_available_channels(auth_handler, nvr_ip, utc_time_interval, content_type, max_channel, max_gap)
+                # A scan cut short by the gap may have missed channels, so it isn't reused by later runs.
+                # A rescan that confirms a still valid cached result doesn't need to rewrite the file.
+                if channels and not max_gap and channels != get_cached_channels(nvr_ip, scan_parameters):
+                    save_channel_mapping(nvr_ip, {
+                        'scanned_at': time.time(),
+                        'parameters': scan_parameters,
+                        'channels': channels
+                    })
         
         if not channels:
             print("No channels found with recordings in the specified time range.")
@@ -285,46 +499,18 @@ def download_from_all_channels(nvr_ip, start_datetime_str, end_datetime_str, use
         print(f"Content type: {'Photos' if content_type == ContentType.PHOTO else 'Videos'}")
         print(f"Max concurrent downloads: {max_concurrent}\n")
         
-        # Download from all channels with threading
-        results_queue = Queue()
-        threads = []
-        active_threads = []
-        
-        # Create threads for all channels
-        for channel_num in channels:
-            thread = threading.Thread(
-                target=download_from_channel_worker,
-                args=(auth_handler, nvr_ip, channel_num, utc_time_interval, content_type, results_queue)
-            )
-            threads.append((channel_num, thread))
-        
-        # Start threads with concurrency limit
-        thread_index = 0
-        while thread_index < len(threads) or active_threads:
-            # Start new threads if under the limit
-            while len(active_threads) < max_concurrent and thread_index < len(threads):
-                channel_num, thread = threads[thread_index]
-                print(f"Starting download from channel {channel_num:02d}...")
-                thread.start()
-                active_threads.append((channel_num, thread))
-                thread_index += 1
-            
-            # Remove completed threads
-            for channel_num, thread in active_threads[:]:
-                if not thread.is_alive():
-                    thread.join()
-                    active_threads.remove((channel_num, thread))
-            
-            # Brief sleep to avoid busy waiting
-            if active_threads:
-                import time
-                time.sleep(0.1)
-        
-        # Collect results
+        # Download from all channels in a pool of max_concurrent worker threads
         results = {}
-        while not results_queue.empty():
-            channel_num, success, count, error = results_queue.get()
-            results[channel_num] = {'success': success, 'count': count, 'error': error}
+        rate_limiter = get_download_rate_limiter(nvr_ip, max_concurrent)
+        with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
+            futures = [
+                executor.submit(download_from_channel_worker, auth_handler, nvr_ip, channel_num, utc_time_interval, content_type,
+                                rate_limiter)
+                for channel_num in channels
+            ]
+            for future in as_completed(futures):
+                channel_num, success, count, error = future.result()
+                results[channel_num] = {'success': success, 'count': count, 'error': error}
         
         return results
         
@@ -339,9 +525,16 @@ def print_summary(nvr_ip, results):
     print(f"DOWNLOAD SUMMARY FOR NVR: {nvr_ip}")
     print("="*70)
     
-    successful = [ch for ch, result in results.items() if result['success']]
-    failed = [ch for ch, result in results.items() if not result['success']]
-    total_files = sum(result['count'] for result in results.values() if result['success'])
+    # Channels are visited in order, so both lists come out sorted
+    successful = []
+    failed = []
+    total_files = 0
+    for ch, result in sorted(results.items()):
+        if result['success']:
+            successful.append((ch, result['count']))
+            total_files += result['count']
+        else:
+            failed.append((ch, result['error']))
     
     print(f"\nTotal channels processed: {len(results)}")
     print(f"Successful: {len(successful)}")
@@ -350,15 +543,13 @@ def print_summary(nvr_ip, results):
     
     if successful:
         print("\n✓ Successful channels:")
-        for ch in sorted(successful):
-            count = results[ch]['count']
-            print(f"  - Channel {ch:02d}: {count} files")
+        for ch, count in successful:
+            print(f"  - {_fmt_channel(ch)}: {count} files")
     
     if failed:
         print("\n✗ Failed channels:")
-        for ch in sorted(failed):
-            error = results[ch]['error']
-            print(f"  - Channel {ch:02d}: {error}")
+        for ch, error in failed:
+            print(f"  - {_fmt_channel(ch)}: {error}")
     
     print("="*70 + "\n")
 
@@ -367,29 +558,29 @@ def parse_channels(channels_str):
     """
     Parse channel numbers from string.
     Supports: "1,2,3" or "1-4" or "1,3-5,7"
+    Raises ValueError for malformed parts, channel 0 and descending ranges.
     """
     if not channels_str:
         return None
     
-    channels = []
-    parts = channels_str.split(',')
-    
-    for part in parts:
-        part = part.strip()
-        if '-' in part:
-            # Range like "1-4"
-            start, end = part.split('-')
-            channels.extend(range(int(start), int(end) + 1))
-        else:
-            # Single channel
-            channels.append(int(part))
+    channels = set()  # Removes duplicates
+    for part in channels_str.split(','):
+        match = CHANNEL_RANGE_PATTERN.fullmatch(part)
+        if not match:
+            raise ValueError(f'Invalid channel or channel range: "{part.strip()}"')
+        
+        first_channel = int(match.group(1))
+        last_channel = int(match.group(2) or first_channel)
+        if first_channel < 1 or last_channel < first_channel:
+            raise ValueError(f'Invalid channel or channel range: "{part.strip()}"')
+        channels.update(range(first_channel, last_channel + 1))
     
-    return sorted(list(set(channels)))  # Remove duplicates and sort
+    return sorted(channels)
 
 
 def parse_parameters():
     usage = """
-  %(prog)s [-u] [-p] [-c MAX_CONCURRENT] [-m MAX_CHANNEL] [--channels CHANNELS] NVR_IP START_DATE START_TIME END_DATE END_TIME"""
+  %(prog)s [-u] [-p] [-c MAX_CONCURRENT] [-m MAX_CHANNEL] [--channels CHANNELS] [--rescan] [--max-gap N] NVR_IP START_DATE START_TIME END_DATE END_TIME"""
 
     epilog = """
 Examples:
@@ -432,24 +623,38 @@ Environment Variables:
                        help=f"maximum channel number to scan (default: {MAX_CHANNEL_TO_SCAN})")
     parser.add_argument("--channels", type=str,
                        help="specific channels to download (e.g., '1,2,3' or '1-8'). If not specified, auto-detect all channels")
+    parser.add_argument("--rescan", action="store_true",
+                       help="scan channels again instead of using the result of a recent scan")
+    parser.add_argument("--max-gap", type=int, default=MAX_EMPTY_CHANNELS_GAP,
+                       help="stop scanning after this many consecutive channels without recordings following a found one, "
+                            "only if the NVR doesn't report its channel count; such scans are not cached "
+                            f"(default: {MAX_EMPTY_CHANNELS_GAP}, scan all)")
 
     if len(sys.argv) == 1:
         parser.print_help()
         return None
     else:
         args = parser.parse_args()
+        try:
+            args.channels = parse_channels(args.channels)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.max_gap < 0:
+            parser.error('--max-gap must not be negative')
         return args
 
 
-def init(nvr_ip):
-    """Initialize logger and directories."""
+def init(nvr_ip, max_concurrent):
+    """Initialize logger, directories and the connection pool shared by max_concurrent channel workers."""
     log_file_name = base_path_to_log_file + f'{nvr_ip}_main.log'
     
     create_directory_for(log_file_name)
     create_directory_for(get_path_to_video_archive(nvr_ip))
     
     Logger.init_logger(write_logs, log_file_name, MAX_BYTES_LOG_FILE_SIZE, MAX_LOG_FILES_COUNT)
-    CameraSdk.init(DEFAULT_TIMEOUT_SECONDS)
+    # Each channel runs at most this many requests at once, and the channel scan runs its probes in parallel
+    requests_per_channel = max(MAX_CONCURRENT_TRACK_SEARCHES, RANGED_DOWNLOAD_PARTS)
+    CameraSdk.init(DEFAULT_TIMEOUT_SECONDS, max(MAX_CONCURRENT_CHANNEL_PROBES, max_concurrent * requests_per_channel))
 
 
 def main():
@@ -464,16 +669,13 @@ def main():
                 return
             
             nvr_ip = parameters.NVR_IP
-            init(nvr_ip)
+            init(nvr_ip, parameters.concurrent)
             
             start_datetime_str = parameters.START_DATE + ' ' + parameters.START_TIME
             end_datetime_str = parameters.END_DATE + ' ' + parameters.END_TIME
             
             content_type = ContentType.PHOTO if parameters.photo else ContentType.VIDEO
             
-            # Parse specific channels if provided
-            specific_channels = parse_channels(parameters.channels) if parameters.channels else None
-            
             # Download from all channels
             results = download_from_all_channels(
                 nvr_ip,
@@ -483,7 +685,9 @@ def main():
                 content_type,
                 parameters.concurrent,
                 parameters.max_channel,
-                specific_channels
+                parameters.channels,
+                parameters.rescan,
+                parameters.max_gap
             )
             
             # Print summary
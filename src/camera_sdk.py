@@ -1,12 +1,15 @@
+import io
 import re
 import socket
+import threading
 import time
 import uuid
 
 import requests
-import shutil
 import defusedxml.ElementTree as DefusedElementTree
 
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter, DEFAULT_POOLSIZE
 from requests.auth import HTTPBasicAuth
 from requests.auth import HTTPDigestAuth
 from xml.etree import ElementTree
@@ -14,6 +17,11 @@ from datetime import timedelta
 
 from src.track import Track
 
+try:
+    from lxml import etree as LxmlElementTree
+except ImportError:
+    LxmlElementTree = None
+
 
 class AuthType:
     BASIC = 1
@@ -21,6 +29,44 @@ class AuthType:
     UNAUTHORISED = 3
 
 
+class NoDelayHTTPAdapter(HTTPAdapter):
+    """HTTP adapter that disables Nagle's algorithm and enables TCP keep-alive on its pooled sockets."""
+    socket_options = [
+        (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    ]
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs.setdefault('socket_options', self.socket_options)
+        super().init_poolmanager(*args, **kwargs)
+
+
+class SharedChallengeDigestAuth(HTTPDigestAuth):
+    """Digest auth that seeds new threads with the last accepted challenge, so they skip the initial 401."""
+
+    def __init__(self, username, password):
+        super().__init__(username, password)
+        self._shared_challenge = {}
+        self._shared_challenge_lock = threading.Lock()
+
+    def init_per_thread_state(self):
+        if not hasattr(self._thread_local, 'init'):
+            super().init_per_thread_state()
+            with self._shared_challenge_lock:
+                challenge = dict(self._shared_challenge)
+            if 'realm' in challenge and 'nonce' in challenge:
+                self._thread_local.chal = challenge
+                self._thread_local.last_nonce = challenge['nonce']
+
+    def handle_401(self, r, **kwargs):
+        # A stale or rejected nonce is answered with a new challenge and retried by the base class
+        response = super().handle_401(r, **kwargs)
+        if response.ok and self._thread_local.chal:
+            with self._shared_challenge_lock:
+                self._shared_challenge = dict(self._thread_local.chal)
+        return response
+
+
 class CameraSdk:
     class FileDownloadingResult:
         OK = 1
@@ -49,7 +95,13 @@ class CameraSdk:
             return cls(cls.TIMEOUT)
 
     default_timeout_seconds = 10
+    session = requests.Session()
     __DEVICE_ERROR_CODE = 500
+    __NOT_FOUND_CODE = 404
+    __OK_CODE = 200
+    __PARTIAL_CONTENT_CODE = 206
+    __CONTENT_RANGE_PATTERN = re.compile(r'bytes\s+(\d+)-(\d+)/')
+    __DOWNLOAD_BUFFER_SIZE = 1024 * 1024
 
     __CAMERA_AVAILABILITY_TEST_PORT = 80
     __VIDEO_TRACK_ID = 101
@@ -61,6 +113,8 @@ class CameraSdk:
     __SEARCH_MEDIA_URL = '/ISAPI/ContentMgmt/search'
     __DOWNLOAD_MEDIA_URL = '/ISAPI/ContentMgmt/download'
     __REBOOT_URL = '/ISAPI/System/reboot'
+    __VIDEO_INPUT_CHANNELS_URL = '/ISAPI/System/Video/inputs/channels'
+    __INPUT_PROXY_CHANNELS_URL = '/ISAPI/ContentMgmt/InputProxy/channels'
 
     # =============================== URLS ===============================
 
@@ -91,29 +145,38 @@ class CameraSdk:
 </downloadRequest>"""
 
     @classmethod
-    def init(cls, default_timeout_seconds):
+    def init(cls, default_timeout_seconds, max_connections=DEFAULT_POOLSIZE):
         cls.default_timeout_seconds = default_timeout_seconds
+        cls.session = cls.create_session(max_connections)
+
+    @staticmethod
+    def create_session(max_connections):
+        # All requests go to one device, so a single pool keeps up to max_connections alive for reuse
+        session = requests.Session()
+        adapter = NoDelayHTTPAdapter(pool_maxsize=max_connections, max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
 
     @classmethod
     def get_error_message_from(cls, answer):
-        answer_text = cls.__clear_xml_from_namespaces(answer.text)
-        answer_xml = DefusedElementTree.fromstring(answer_text)
+        answer_xml = cls.__parse_answer_xml(answer)
 
-        answer_status_element = answer_xml.find('statusString')
-        answer_substatus_element = answer_xml.find('subStatusCode')
+        answer_status_element = answer_xml.find('{*}statusString')
+        answer_substatus_element = answer_xml.find('{*}subStatusCode')
 
         if answer_status_element is not None and answer_substatus_element is not None:
             status = answer_status_element.text
             substatus = answer_substatus_element.text
             message = 'Error {} {}: {} - {}'.format(answer.status_code, answer.reason, status, substatus)
         else:
-            message = answer_text
+            message = cls.__clear_xml_from_namespaces(answer.text)
 
         return message
 
     @classmethod
     def reboot_camera(cls, auth_handler, cam_ip):
-        answer = requests.put(cls.__get_service_url(cam_ip, cls.__REBOOT_URL), auth=auth_handler, data=[], timeout=cls.default_timeout_seconds)
+        answer = cls.session.put(cls.__get_service_url(cam_ip, cls.__REBOOT_URL), auth=auth_handler, data=[], timeout=cls.default_timeout_seconds)
         if not answer:
             raise RuntimeError(cls.get_error_message_from(answer))
 
@@ -135,14 +198,47 @@ class CameraSdk:
     def get_time_offset(cls, auth_handler, cam_ip):
         answer = cls.__make_get_request(auth_handler, cam_ip, cls.__TIME_URL)
         if answer:
-            time_info_text = cls.__clear_xml_from_namespaces(answer.text)
-            time_info_xml = DefusedElementTree.fromstring(time_info_text)
-            timezone_raw = time_info_xml.find('timeZone')
+            time_info_xml = cls.__parse_answer_xml(answer)
+            timezone_raw = time_info_xml.find('{*}timeZone')
             time_offset = cls.parse_timezone(timezone_raw.text)
             return time_offset
         else:
             raise RuntimeError(cls.get_error_message_from(answer))
 
+    @classmethod
+    def get_max_channel_number(cls, auth_handler, cam_ip):
+        # Analog inputs and IP camera (proxy) channels are reported by separate endpoints
+        channel_lists = ((cls.__VIDEO_INPUT_CHANNELS_URL, 'VideoInputChannel'), (cls.__INPUT_PROXY_CHANNELS_URL, 'InputProxyChannel'))
+
+        channel_numbers = []
+        for url, channel_tag in channel_lists:
+            answer = cls.__make_get_request(auth_handler, cam_ip, url)
+            if not answer:
+                if cls.__is_not_supported(answer):
+                    continue
+                # Without this list the channel count is unknown, a partial one would hide its channels
+                return None
+            channels_xml = cls.__parse_answer_xml(answer)
+            for channel in channels_xml.findall('{*}' + channel_tag):
+                channel_id = channel.find('{*}id')
+                # Entries without a usable id are skipped rather than discarding the whole list
+                if channel_id is not None and channel_id.text is not None and channel_id.text.strip().isdigit():
+                    channel_numbers.append(int(channel_id.text))
+
+        return max(channel_numbers) if channel_numbers else None
+
+    @classmethod
+    def __is_not_supported(cls, answer):
+        # Devices without an endpoint answer 404 or an ISAPI status with the notSupport sub status
+        if answer.status_code == cls.__NOT_FOUND_CODE:
+            return True
+        try:
+            answer_xml = cls.__parse_answer_xml(answer)
+        except (SyntaxError, ValueError):
+            return False
+        substatus_element = answer_xml.find('{*}subStatusCode')
+        return substatus_element is not None and substatus_element.text == 'notSupport'
+
     @staticmethod
     def parse_timezone(raw_timezone):
         timezone_text = raw_timezone[3:11]
@@ -162,24 +258,19 @@ class CameraSdk:
         if auth_type == AuthType.BASIC:
             return HTTPBasicAuth(name, password)
         elif auth_type == AuthType.DIGEST:
-            return HTTPDigestAuth(name, password)
+            return SharedChallengeDigestAuth(name, password)
         else:
             return None
 
     @classmethod
     def download_file(cls, auth_handler, cam_ip, file_uri, file_name):
-        request = DefusedElementTree.fromstring(cls.__DOWNLOAD_REQUEST_XML)
-        playback_uri = request.find('playbackURI')
-        playback_uri.text = file_uri
-        request_data = ElementTree.tostring(request, encoding='utf8', method='xml')
+        request_data = cls.__get_download_request_data(file_uri)
 
         url = cls.__get_service_url(cam_ip, cls.__DOWNLOAD_MEDIA_URL)
         try:
-            answer = requests.get(url=url, auth=auth_handler, data=request_data, stream=True, timeout=cls.default_timeout_seconds)
+            answer = cls.session.get(url=url, auth=auth_handler, data=request_data, stream=True, timeout=cls.default_timeout_seconds)
             if answer:
-                with open(file_name, 'wb') as out_file:
-                    shutil.copyfileobj(answer.raw, out_file)
-                answer.close()
+                cls.__save_answer_to(answer, file_name)
                 return cls.FileDownloadingResult.ok()
             else:
                 return cls.get_file_downloading_result_error(answer)
@@ -187,6 +278,79 @@ class CameraSdk:
         except (requests.exceptions.Timeout, requests.packages.urllib3.exceptions.TimeoutError):
             return cls.FileDownloadingResult.timeout()
 
+    @classmethod
+    def download_file_in_parts(cls, auth_handler, cam_ip, file_uri, file_name, parts_count):
+        request_data = cls.__get_download_request_data(file_uri)
+
+        url = cls.__get_service_url(cam_ip, cls.__DOWNLOAD_MEDIA_URL)
+        try:
+            answer = cls.session.get(url=url, auth=auth_handler, data=request_data, headers=cls.__get_range_headers(0, 0),
+                                     stream=True, timeout=cls.default_timeout_seconds)
+            if not answer:
+                return cls.get_file_downloading_result_error(answer)
+
+            if answer.status_code == cls.__OK_CODE:
+                # The device doesn't support ranges and sends the whole file
+                cls.__save_answer_to(answer, file_name)
+                return cls.FileDownloadingResult.ok()
+
+            file_size = cls.__get_total_size_from(answer)
+            is_encoded = cls.__is_encoded(answer)
+            answer.close()
+            if file_size is None or file_size <= 0 or is_encoded:
+                # Ranges can't be planned without the total size, e.g. for 'Content-Range: bytes 0-0/*',
+                # and ranges of encoded content can't be decoded separately
+                return cls.download_file(auth_handler, cam_ip, file_uri, file_name)
+
+            with open(file_name, 'wb') as out_file:
+                out_file.truncate(file_size)
+
+            part_size = -(-file_size // parts_count)
+            byte_ranges = [(first_byte, min(first_byte + part_size, file_size) - 1) for first_byte in range(0, file_size, part_size)]
+            with ThreadPoolExecutor(max_workers=len(byte_ranges)) as executor:
+                results = list(executor.map(
+                    lambda byte_range: cls.__download_range(auth_handler, url, request_data, file_name, *byte_range),
+                    byte_ranges
+                ))
+
+            if None in results:
+                # A part was answered without its range, the whole file is needed in one stream after all
+                return cls.download_file(auth_handler, cam_ip, file_uri, file_name)
+            for result in results:
+                if result.result_type != cls.FileDownloadingResult.OK:
+                    return result
+            return cls.FileDownloadingResult.ok()
+
+        except (requests.exceptions.Timeout, requests.packages.urllib3.exceptions.TimeoutError):
+            return cls.FileDownloadingResult.timeout()
+
+    @classmethod
+    def __download_range(cls, auth_handler, url, request_data, file_name, first_byte, last_byte):
+        answer = cls.session.get(url=url, auth=auth_handler, data=request_data, headers=cls.__get_range_headers(first_byte, last_byte),
+                                 stream=True, timeout=cls.default_timeout_seconds)
+        if not answer:
+            return cls.get_file_downloading_result_error(answer)
+        if answer.status_code != cls.__PARTIAL_CONTENT_CODE or cls.__is_encoded(answer):
+            # Not an error of this part, the caller downloads the whole file instead
+            answer.close()
+            return None
+
+        # A capped or shifted range would leave a hole in the preallocated file
+        content_range = cls.__CONTENT_RANGE_PATTERN.match(answer.headers.get('Content-Range', ''))
+        if not content_range or (int(content_range.group(1)), int(content_range.group(2))) != (first_byte, last_byte):
+            answer.close()
+            return cls.FileDownloadingResult.error('Device answered bytes {}-{} with range "{}"'.format(
+                first_byte, last_byte, answer.headers.get('Content-Range', '')))
+
+        with open(file_name, 'r+b') as out_file:
+            out_file.seek(first_byte)
+            written_count = cls.__copy_stream(answer.raw, out_file)
+        answer.close()
+        if written_count != last_byte - first_byte + 1:
+            return cls.FileDownloadingResult.error('Received {} of {} bytes for bytes {}-{}'.format(
+                written_count, last_byte - first_byte + 1, first_byte, last_byte))
+        return cls.FileDownloadingResult.ok()
+
     @classmethod
     def get_file_downloading_result_error(cls, answer):
         error_text = cls.get_error_message_from(answer)
@@ -252,36 +416,123 @@ class CameraSdk:
 
     @classmethod
     def create_tracks_from_info(cls, answer, local_time_offset):
-        answer_text = cls.__clear_xml_from_namespaces(answer.text)
-        answer_xml = DefusedElementTree.fromstring(answer_text)
-
-        match_list = answer_xml.find('matchList')
-        match_items = match_list.findall('searchMatchItem')
-
         tracks = []
-        for match_item in match_items:
-            media_descriptor = match_item.find('mediaSegmentDescriptor')
-            playback_uri = media_descriptor.find('playbackURI')
+        for match_item in cls.__iterparse_answer_xml(answer, 'searchMatchItem'):
+            media_descriptor = match_item.find('{*}mediaSegmentDescriptor')
+            playback_uri = media_descriptor.find('{*}playbackURI')
             new_track = Track(playback_uri.text, local_time_offset)
             tracks.append(new_track)
 
         return tracks
 
+    @classmethod
+    def __get_download_request_data(cls, file_uri):
+        request = DefusedElementTree.fromstring(cls.__DOWNLOAD_REQUEST_XML)
+        playback_uri = request.find('playbackURI')
+        playback_uri.text = file_uri
+        return ElementTree.tostring(request, encoding='utf8', method='xml')
+
+    @staticmethod
+    def __get_range_headers(first_byte, last_byte):
+        # Range offsets of encoded content don't match the file, so the file is asked for as is
+        return {'Range': 'bytes={}-{}'.format(first_byte, last_byte), 'Accept-Encoding': 'identity'}
+
+    @staticmethod
+    def __is_encoded(answer):
+        return answer.headers.get('Content-Encoding', 'identity').strip().lower() != 'identity'
+
+    @classmethod
+    def __save_answer_to(cls, answer, file_name):
+        with open(file_name, 'wb') as out_file:
+            if cls.__is_encoded(answer):
+                # Reading the raw stream bypasses requests' decoding, so undo the content encoding here.
+                # Decoded data may not fit into a fixed buffer, so it is read in chunks instead.
+                answer.raw.decode_content = True
+                cls.__copy_decoded_stream(answer.raw, out_file)
+            else:
+                cls.__copy_stream(answer.raw, out_file)
+        answer.close()
+
+    @classmethod
+    def __copy_decoded_stream(cls, source, out_file):
+        while True:
+            chunk = source.read(cls.__DOWNLOAD_BUFFER_SIZE)
+            if not chunk:
+                break
+            out_file.write(chunk)
+
+    @classmethod
+    def __copy_stream(cls, source, out_file):
+        # One reusable buffer per file instead of a new bytes object per chunk
+        buffer = memoryview(bytearray(cls.__DOWNLOAD_BUFFER_SIZE))
+        written_count = 0
+        while True:
+            read_count = source.readinto(buffer)
+            if not read_count:
+                break
+            out_file.write(buffer[:read_count])
+            written_count += read_count
+        return written_count
+
+    @classmethod
+    def __get_total_size_from(cls, answer):
+        content_range = answer.headers.get('Content-Range', '')
+        if answer.status_code != cls.__PARTIAL_CONTENT_CODE or '/' not in content_range:
+            return None
+
+        total_size = content_range.rsplit('/', 1)[1].strip()
+        return int(total_size) if total_size.isdigit() else None
+
+    @staticmethod
+    def has_tracks(answer):
+        # Stop parsing at the first match instead of building the whole track list
+        for _, element in DefusedElementTree.iterparse(io.BytesIO(answer.content), events=('start',)):
+            if element.tag.rpartition('}')[2] == 'searchMatchItem':
+                return True
+        return False
+
     @staticmethod
     def __get_service_url(cam_ip, relative_url):
         return 'http://' + cam_ip + relative_url
 
+    @staticmethod
+    def __parse_answer_xml(answer):
+        # Elements are looked up with the '{*}' namespace wildcard, so the document is parsed as is
+        if LxmlElementTree is not None:
+            parser = LxmlElementTree.XMLParser(resolve_entities=False, no_network=True)
+            return LxmlElementTree.fromstring(answer.content, parser=parser)
+        return DefusedElementTree.fromstring(answer.content)
+
+    @staticmethod
+    def __iterparse_answer_xml(answer, tag):
+        # Yields the completed elements with the given tag in any namespace without building the whole tree,
+        # every element is cleared once the caller is done with it
+        if LxmlElementTree is not None:
+            elements = LxmlElementTree.iterparse(io.BytesIO(answer.content), events=('end',), tag='{*}' + tag,
+                                                 resolve_entities=False, no_network=True)
+            for _, element in elements:
+                yield element
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+            return
+
+        for _, element in DefusedElementTree.iterparse(io.BytesIO(answer.content), events=('end',)):
+            if element.tag.rpartition('}')[2] == tag:
+                yield element
+                element.clear()
+
     @staticmethod
     def __clear_xml_from_namespaces(xml_text):
         return re.sub(' xmlns="[^"]+"', '', xml_text, count=0)
 
     @classmethod
     def __make_get_request(cls, auth_handler, cam_ip, url):
-        return requests.get(url=cls.__get_service_url(cam_ip, url), auth=auth_handler, timeout=cls.default_timeout_seconds)
+        return cls.session.get(url=cls.__get_service_url(cam_ip, url), auth=auth_handler, timeout=cls.default_timeout_seconds)
 
     @classmethod
     def __make_post_request(cls, auth_handler, cam_ip, url, request_data):
-        return requests.post(url=cls.__get_service_url(cam_ip, url), auth=auth_handler, data=request_data, timeout=cls.default_timeout_seconds)
+        return cls.session.post(url=cls.__get_service_url(cam_ip, url), auth=auth_handler, data=request_data, timeout=cls.default_timeout_seconds)
 
     @staticmethod
     def __replace_subelement_with(parent, new_subelement):
@@ -56,6 +56,11 @@ class TimeInterval:
         local_end_time = self.end_time + self.local_time_offset
         return TimeInterval(local_start_time, local_end_time)
 
+    def split(self, parts):
+        step = (self.end_time - self.start_time) / parts
+        bounds = [self.start_time + step * i for i in range(parts)] + [self.end_time]
+        return [TimeInterval(bounds[i], bounds[i + 1], self.local_time_offset) for i in range(parts)]
+
     def to_utc(self):
         utc_start_time = self.start_time - self.local_time_offset
         utc_end_time = self.end_time - self.local_time_offset
@@ -0,0 +1,24 @@
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._last_refill_time = time.monotonic()
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            self.__refill()
+            while self._tokens < 1:
+                self._condition.wait((1 - self._tokens) / self._rate)
+                self.__refill()
+            self._tokens -= 1
+
+    def __refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._last_refill_time) * self._rate)
+        self._last_refill_time = now
@@ -1,18 +1,29 @@
 import os
+import re
 import urllib.parse
 
+_DANGEROUS_FILENAME_PARTS = re.compile(r'\.\.|[\\/\x00]')
+
+# Directories already created by this process
+_created_directories = set()
+
 
 def validate_path(file_path, base_path):
     """
     Validate that the resolved file path is within the expected base directory.
     This prevents path traversal attacks.
+    Callers checking many files should pass an absolute base_path, which is only normalized here.
     """
-    # Resolve absolute paths
-    abs_base = os.path.abspath(base_path)
     abs_file = os.path.abspath(file_path)
+    # Without a trailing separator or relative parts the base compares equal to the common path
+    base_path = os.path.abspath(base_path)
     
-    # Check that the file path starts with the base path
-    return abs_file.startswith(abs_base + os.sep) or abs_file == abs_base
+    # Compare whole path components, so '/archive-evil' is not taken as inside '/archive'
+    try:
+        return os.path.commonpath([abs_file, base_path]) == base_path
+    except ValueError:
+        # Paths on different drives
+        return False
 
 
 def sanitize_filename(filename):
@@ -21,16 +32,14 @@ def sanitize_filename(filename):
     Handles path traversal attempts, URL-encoded characters, and null bytes.
     """
     # URL decode to catch encoded separators like %2F (/), %5C (\\)
-    decoded = urllib.parse.unquote(filename)
+    decoded = urllib.parse.unquote(filename) if '%' in filename else filename
     
     # Extract just the base filename to remove any path components
     # This handles cases like '../file' or '/etc/passwd'
     result = os.path.basename(decoded)
     
-    # Remove any remaining path separators and null bytes
-    dangerous_chars = ['..', '/', '\\', '\x00']
-    for char in dangerous_chars:
-        result = result.replace(char, '_')
+    # Replace any remaining path separators and null bytes in a single pass
+    result = _DANGEROUS_FILENAME_PARTS.sub('_', result)
     
     # If the result is empty after sanitization, use a default
     if not result or result == '.':
@@ -41,5 +50,9 @@ def sanitize_filename(filename):
 
 def create_directory_for(file_path):
     directory = os.path.dirname(file_path)
-    if not os.path.exists(directory):
-        os.makedirs(directory)
+    if directory in _created_directories:
+        return
+
+    # exist_ok makes a concurrent creation of the same directory harmless
+    os.makedirs(directory, exist_ok=True)
+    _created_directories.add(directory)
@@ -1,7 +1,14 @@
+import gzip
+import io
+import os
+import socket
+import tempfile
 import unittest
 from datetime import timedelta
 
-from src.camera_sdk import CameraSdk
+from urllib3 import HTTPResponse
+
+from src.camera_sdk import CameraSdk, NoDelayHTTPAdapter
 
 
 class TestParseTimeInfo(unittest.TestCase):
@@ -34,5 +41,361 @@ class TestParseTimeInfo(unittest.TestCase):
         self.assertEqual(expected_time_offset, actual_time_offset)
 
 
+class Answer:
+    def __init__(self, text):
+        self.text = text
+        self.content = text.encode('utf-8')
+
+
+SEARCH_RESULT_WITH_MATCHES = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<CMSearchResult version="1.0" xmlns="http://www.hikvision.com/ver20/XMLSchema">
+    <numOfMatches>2</numOfMatches>
+    <matchList>
+        <searchMatchItem>
+            <mediaSegmentDescriptor>
+                <playbackURI>rtsp://10.10.10.10/Streaming/tracks/101/?starttime=20200415T003000Z&amp;endtime=20200415T004000Z&amp;name=00000000001&amp;size=1024</playbackURI>
+            </mediaSegmentDescriptor>
+        </searchMatchItem>
+        <searchMatchItem>
+            <mediaSegmentDescriptor>
+                <playbackURI>rtsp://10.10.10.10/Streaming/tracks/101/?starttime=20200415T004000Z&amp;endtime=20200415T005000Z&amp;name=00000000002&amp;size=2048</playbackURI>
+            </mediaSegmentDescriptor>
+        </searchMatchItem>
+    </matchList>
+</CMSearchResult>"""
+
+SEARCH_RESULT_WITHOUT_MATCHES = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<CMSearchResult version="1.0" xmlns="http://www.hikvision.com/ver20/XMLSchema">
+    <responseStatusStrg>NO MATCHES</responseStatusStrg>
+    <numOfMatches>0</numOfMatches>
+    <matchList/>
+</CMSearchResult>"""
+
+
+class TestHasTracks(unittest.TestCase):
+    def test_answer_with_match(self):
+        self.assertTrue(CameraSdk.has_tracks(Answer(SEARCH_RESULT_WITH_MATCHES)))
+
+    def test_answer_without_matches(self):
+        self.assertFalse(CameraSdk.has_tracks(Answer(SEARCH_RESULT_WITHOUT_MATCHES)))
+
+
+class TestCreateTracksFromInfo(unittest.TestCase):
+    def test_tracks_from_namespaced_answer(self):
+        local_time_offset = timedelta(hours=3)
+
+        tracks = CameraSdk.create_tracks_from_info(Answer(SEARCH_RESULT_WITH_MATCHES), local_time_offset)
+
+        self.assertEqual(['00000000001', '00000000002'], [track.name() for track in tracks])
+        self.assertEqual(local_time_offset, tracks[0].get_time_interval().local_time_offset)
+
+    def test_no_tracks_in_empty_answer(self):
+        tracks = CameraSdk.create_tracks_from_info(Answer(SEARCH_RESULT_WITHOUT_MATCHES), timedelta())
+        self.assertEqual([], tracks)
+
+
+VIDEO_INPUT_CHANNELS = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<VideoInputChannelList version="2.0" xmlns="http://www.hikvision.com/ver20/XMLSchema">
+    <VideoInputChannel>
+        <id>1</id>
+        <inputPort>1</inputPort>
+    </VideoInputChannel>
+    <VideoInputChannel>
+        <id>4</id>
+        <inputPort>4</inputPort>
+    </VideoInputChannel>
+</VideoInputChannelList>"""
+
+INPUT_PROXY_CHANNELS = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<InputProxyChannelList version="2.0" xmlns="http://www.hikvision.com/ver20/XMLSchema">
+    <InputProxyChannel>
+        <id/>
+    </InputProxyChannel>
+    <InputProxyChannel>
+        <id>12</id>
+    </InputProxyChannel>
+    <InputProxyChannel>
+        <name>Camera without id</name>
+    </InputProxyChannel>
+</InputProxyChannelList>"""
+
+NOT_SUPPORTED_STATUS = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<ResponseStatus version="2.0" xmlns="http://www.hikvision.com/ver20/XMLSchema">
+    <requestURL>/ISAPI/ContentMgmt/InputProxy/channels</requestURL>
+    <statusCode>4</statusCode>
+    <statusString>Invalid Operation</statusString>
+    <subStatusCode>notSupport</subStatusCode>
+</ResponseStatus>"""
+
+
+class ChannelListAnswer(Answer):
+    def __init__(self, text, status_code=200):
+        super().__init__(text)
+        self.status_code = status_code
+        self.ok = status_code < 400
+
+    def __bool__(self):
+        return self.ok
+
+
+class ChannelListSession:
+    def __init__(self, answers):
+        self.answers = answers
+
+    def get(self, url, auth, timeout):
+        for url_suffix, answer in self.answers.items():
+            if url.endswith(url_suffix):
+                return answer
+        return ChannelListAnswer('', 404)
+
+
+class TestGetMaxChannelNumber(unittest.TestCase):
+    def setUp(self):
+        self.original_session = CameraSdk.session
+
+    def tearDown(self):
+        CameraSdk.session = self.original_session
+
+    def get_max_channel_number(self, answers):
+        CameraSdk.session = ChannelListSession(answers)
+        return CameraSdk.get_max_channel_number(None, '10.10.10.10')
+
+    def test_highest_id_of_both_channel_lists(self):
+        max_channel_number = self.get_max_channel_number({
+            '/System/Video/inputs/channels': ChannelListAnswer(VIDEO_INPUT_CHANNELS),
+            '/InputProxy/channels': ChannelListAnswer(INPUT_PROXY_CHANNELS)
+        })
+
+        self.assertEqual(12, max_channel_number)
+
+    def test_missing_channel_list_is_ignored(self):
+        max_channel_number = self.get_max_channel_number({
+            '/System/Video/inputs/channels': ChannelListAnswer(VIDEO_INPUT_CHANNELS),
+            '/InputProxy/channels': ChannelListAnswer('', 404)
+        })
+
+        self.assertEqual(4, max_channel_number)
+
+    def test_unsupported_channel_list_is_ignored(self):
+        max_channel_number = self.get_max_channel_number({
+            '/System/Video/inputs/channels': ChannelListAnswer(VIDEO_INPUT_CHANNELS),
+            '/InputProxy/channels': ChannelListAnswer(NOT_SUPPORTED_STATUS, 403)
+        })
+
+        self.assertEqual(4, max_channel_number)
+
+    def test_failed_channel_list_makes_count_unknown(self):
+        max_channel_number = self.get_max_channel_number({
+            '/System/Video/inputs/channels': ChannelListAnswer(VIDEO_INPUT_CHANNELS),
+            '/InputProxy/channels': ChannelListAnswer('Internal Server Error', 500)
+        })
+
+        self.assertIsNone(max_channel_number)
+
+    def test_no_channel_lists(self):
+        self.assertIsNone(self.get_max_channel_number({}))
+
+
+class TestNoDelayHTTPAdapter(unittest.TestCase):
+    def test_pool_sockets_disable_nagle(self):
+        adapter = NoDelayHTTPAdapter()
+
+        socket_options = adapter.poolmanager.connection_pool_kw['socket_options']
+        self.assertIn((socket.IPPROTO_TCP, socket.TCP_NODELAY, 1), socket_options)
+
+    def test_pool_sockets_enable_keep_alive(self):
+        adapter = NoDelayHTTPAdapter()
+
+        socket_options = adapter.poolmanager.connection_pool_kw['socket_options']
+        self.assertIn((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1), socket_options)
+
+
+class DownloadAnswer:
+    def __init__(self, status_code, body=b'', headers=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.reason = ''
+        self.headers = headers or {}
+        if 'Content-Encoding' in self.headers:
+            self.raw = HTTPResponse(io.BytesIO(body), headers=self.headers, preload_content=False, decode_content=False)
+        else:
+            self.raw = io.BytesIO(body)
+        self.text = ''
+        self.content = b''
+
+    def __bool__(self):
+        return self.ok
+
+    def close(self):
+        pass
+
+
+class DownloadSession:
+    """Serves one file, answering range requests like a device would."""
+
+    def __init__(self, content, supports_ranges=True, total_size_text=None, probe_only_ranges=False,
+                 max_range_size=None, missing_bytes=0, gzip_encoded=False):
+        self.content = content
+        self.supports_ranges = supports_ranges
+        self.total_size_text = str(len(content)) if total_size_text is None else total_size_text
+        self.probe_only_ranges = probe_only_ranges
+        self.max_range_size = max_range_size
+        self.missing_bytes = missing_bytes
+        self.gzip_encoded = gzip_encoded
+        self.requested_ranges = []
+        self.ranges_asked_as_identity = True
+
+    def get(self, url, auth, data, headers=None, stream=False, timeout=None):
+        byte_range = (headers or {}).get('Range')
+        self.requested_ranges.append(byte_range)
+        is_probe = byte_range == 'bytes=0-0'
+        if byte_range is not None and (headers or {}).get('Accept-Encoding') != 'identity':
+            self.ranges_asked_as_identity = False
+        if self.gzip_encoded:
+            # Ranges are served too, but of the encoded content
+            encoded_content = gzip.compress(self.content)
+            if byte_range is None:
+                return DownloadAnswer(200, encoded_content, {'Content-Encoding': 'gzip'})
+            content_range = 'bytes 0-0/{}'.format(len(encoded_content))
+            return DownloadAnswer(206, encoded_content[:1], {'Content-Range': content_range, 'Content-Encoding': 'gzip'})
+        if byte_range is None or not self.supports_ranges or (self.probe_only_ranges and not is_probe):
+            return DownloadAnswer(200, self.content)
+
+        first_byte, last_byte = (int(position) for position in byte_range[len('bytes='):].split('-'))
+        if self.max_range_size and not is_probe:
+            last_byte = min(last_byte, first_byte + self.max_range_size - 1)
+        body = self.content[first_byte:last_byte + 1]
+        if not is_probe:
+            body = body[:len(body) - self.missing_bytes]
+        content_range = 'bytes {}-{}/{}'.format(first_byte, last_byte, self.total_size_text)
+        return DownloadAnswer(206, body, {'Content-Range': content_range})
+
+
+class TestDownloadFile(unittest.TestCase):
+    # Compresses well and decodes to more than the download buffer holds
+    FILE_CONTENT = bytes(range(256)) * 16 * 1024
+
+    def setUp(self):
+        self.original_session = CameraSdk.session
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.temp_dir.name, 'video.mp4')
+
+    def tearDown(self):
+        CameraSdk.session = self.original_session
+        self.temp_dir.cleanup()
+
+    def download(self, session):
+        CameraSdk.session = session
+        result = CameraSdk.download_file(None, '10.10.10.10', 'rtsp://uri', self.file_name)
+        with open(self.file_name, 'rb') as f:
+            return result, f.read()
+
+    def test_file_is_saved(self):
+        result, content = self.download(DownloadSession(self.FILE_CONTENT))
+
+        self.assertEqual(CameraSdk.FileDownloadingResult.OK, result.result_type)
+        self.assertEqual(self.FILE_CONTENT, content)
+
+    def test_encoded_file_is_decoded(self):
+        result, content = self.download(DownloadSession(self.FILE_CONTENT, gzip_encoded=True))
+
+        self.assertEqual(CameraSdk.FileDownloadingResult.OK, result.result_type)
+        self.assertEqual(self.FILE_CONTENT, content)
+
+
+class TestDownloadFileInParts(unittest.TestCase):
+    FILE_CONTENT = bytes(range(256)) * 40
+
+    def setUp(self):
+        self.original_session = CameraSdk.session
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.temp_dir.name, 'video.mp4')
+
+    def tearDown(self):
+        CameraSdk.session = self.original_session
+        self.temp_dir.cleanup()
+
+    def download(self, session, parts_count=4):
+        CameraSdk.session = session
+        result = CameraSdk.download_file_in_parts(None, '10.10.10.10', 'rtsp://uri', self.file_name, parts_count)
+        with open(self.file_name, 'rb') as f:
+            return result, f.read()
+
+    def test_file_is_reassembled_from_ranges(self):
+        session = DownloadSession(self.FILE_CONTENT)
+
+        result, content = self.download(session)
+
+        self.assertEqual(CameraSdk.FileDownloadingResult.OK, result.result_type)
+        self.assertEqual(self.FILE_CONTENT, content)
+        self.assertEqual(['bytes=0-0', 'bytes=0-2559', 'bytes=2560-5119', 'bytes=5120-7679', 'bytes=7680-10239'],
+                         sorted(session.requested_ranges, key=lambda byte_range: int(byte_range[6:].split('-')[0])))
+        self.assertTrue(session.ranges_asked_as_identity)
+
+    def test_encoded_file_is_downloaded_whole_and_decoded(self):
+        session = DownloadSession(self.FILE_CONTENT, gzip_encoded=True)
+
+        result, content = self.download(session)
+
+        self.assertEqual(CameraSdk.FileDownloadingResult.OK, result.result_type)
+        self.assertEqual(self.FILE_CONTENT, content)
+        self.assertEqual(['bytes=0-0', None], session.requested_ranges)
+
+    def test_whole_answer_is_saved_when_ranges_are_unsupported(self):
+        session = DownloadSession(self.FILE_CONTENT, supports_ranges=False)
+
+        result, content = self.download(session)
+
+        self.assertEqual(CameraSdk.FileDownloadingResult.OK, result.result_type)
+        self.assertEqual(self.FILE_CONTENT, content)
+        self.assertEqual(['bytes=0-0'], session.requested_ranges)
+
+    def test_whole_file_is_downloaded_when_total_size_is_unknown(self):
+        session = DownloadSession(self.FILE_CONTENT, total_size_text='*')
+
+        result, content = self.download(session)
+
+        self.assertEqual(CameraSdk.FileDownloadingResult.OK, result.result_type)
+        self.assertEqual(self.FILE_CONTENT, content)
+        self.assertEqual(['bytes=0-0', None], session.requested_ranges)
+
+    def test_whole_file_is_downloaded_when_total_size_is_zero(self):
+        session = DownloadSession(self.FILE_CONTENT, total_size_text='0')
+
+        result, content = self.download(session)
+
+        self.assertEqual(CameraSdk.FileDownloadingResult.OK, result.result_type)
+        self.assertEqual(self.FILE_CONTENT, content)
+        self.assertEqual(['bytes=0-0', None], session.requested_ranges)
+
+    def test_whole_file_is_downloaded_when_parts_are_not_ranged(self):
+        session = DownloadSession(self.FILE_CONTENT, probe_only_ranges=True)
+
+        result, content = self.download(session)
+
+        self.assertEqual(CameraSdk.FileDownloadingResult.OK, result.result_type)
+        self.assertEqual(self.FILE_CONTENT, content)
+        self.assertEqual(None, session.requested_ranges[-1])
+
+    def test_capped_range_is_an_error(self):
+        session = DownloadSession(self.FILE_CONTENT, max_range_size=1024)
+
+        result, _ = self.download(session)
+
+        self.assertEqual(CameraSdk.FileDownloadingResult.ERROR, result.result_type)
+
+    def test_short_part_is_an_error(self):
+        session = DownloadSession(self.FILE_CONTENT, missing_bytes=10)
+
+        result, _ = self.download(session)
+
+        self.assertEqual(CameraSdk.FileDownloadingResult.ERROR, result.result_type)
+
+
 if __name__ == '__main__':
     unittest.main()
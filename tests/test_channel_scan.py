@@ -0,0 +1,144 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+import media_download_all_channels
+from media_download_all_channels import (
+    get_available_channels,
+    get_cached_channels,
+    get_channel_scan_parameters,
+    get_path_to_channel_mapping,
+    load_channel_mapping,
+    save_channel_mapping,
+    CHANNEL_SCAN_CACHE_SECONDS
+)
+from src.time_interval import TimeInterval
+
+
+class TestGetAvailableChannels(unittest.TestCase):
+    def scan(self, recording_channels, reported_max_channel, max_channel=64, max_gap=0):
+        probed_channels = []
+
+        def channel_has_recordings(auth_handler, nvr_ip, channel_num, utc_time_interval, content_type):
+            probed_channels.append(channel_num)
+            return channel_num in recording_channels
+
+        with mock.patch.object(media_download_all_channels, 'get_max_channel_number', return_value=reported_max_channel), \
+                mock.patch.object(media_download_all_channels, 'channel_has_recordings', channel_has_recordings), \
+                mock.patch('builtins.print'):
+            channels = get_available_channels(None, '10.10.10.10', None, 'mp4', max_channel, max_gap)
+        return channels, sorted(probed_channels)
+
+    def test_channels_after_gap_are_found_by_default(self):
+        channels, probed_channels = self.scan(recording_channels={1, 2, 3, 4, 40}, reported_max_channel=None)
+
+        self.assertEqual([1, 2, 3, 4, 40], channels)
+        self.assertEqual(list(range(1, 65)), probed_channels)
+
+    def test_scan_stops_after_gap_when_channel_count_is_unknown(self):
+        channels, probed_channels = self.scan(recording_channels={1, 2, 3, 4, 40}, reported_max_channel=None, max_gap=8)
+
+        self.assertEqual([1, 2, 3, 4], channels)
+        self.assertEqual(list(range(1, 17)), probed_channels)
+
+    def test_reported_channels_are_all_scanned_despite_gap(self):
+        recording_channels = set(range(1, 9)) | set(range(17, 33))
+
+        channels, probed_channels = self.scan(recording_channels, reported_max_channel=32, max_gap=8)
+
+        self.assertEqual(sorted(recording_channels), channels)
+        self.assertEqual(list(range(1, 33)), probed_channels)
+
+
+class TestChannelMapping(unittest.TestCase):
+    NVR_IP = '10.10.10.10'
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        archive_patcher = mock.patch.object(media_download_all_channels, 'path_to_media_archive', self.temp_dir.name + '/')
+        archive_patcher.start()
+        self.addCleanup(archive_patcher.stop)
+        self.addCleanup(self.temp_dir.cleanup)
+        media_download_all_channels._load_channel_mapping_cached.cache_clear()
+
+        time_interval = TimeInterval.from_string('2020-02-12 00:00:00', '2020-02-12 06:00:00')
+        self.scan_parameters = get_channel_scan_parameters(time_interval, 'mp4', 32)
+
+    def save_scan_result(self, channels, scanned_at=None):
+        save_channel_mapping(self.NVR_IP, {
+            'scanned_at': time.time() if scanned_at is None else scanned_at,
+            'parameters': self.scan_parameters,
+            'channels': channels
+        })
+
+    def test_round_trip_with_orjson(self):
+        if media_download_all_channels.orjson is None:
+            self.skipTest('orjson is not installed')
+
+        self.save_scan_result([1, 2, 5])
+
+        self.assertEqual([1, 2, 5], get_cached_channels(self.NVR_IP, self.scan_parameters))
+
+    def test_round_trip_with_json(self):
+        with mock.patch.object(media_download_all_channels, 'orjson', None):
+            self.save_scan_result([1, 2, 5])
+
+            self.assertEqual([1, 2, 5], get_cached_channels(self.NVR_IP, self.scan_parameters))
+
+    def test_results_of_other_nvrs_are_kept(self):
+        save_channel_mapping('10.10.10.11', {'scanned_at': time.time(), 'parameters': self.scan_parameters, 'channels': [3]})
+        self.save_scan_result([1])
+
+        self.assertEqual([3], get_cached_channels('10.10.10.11', self.scan_parameters))
+        self.assertEqual([1], get_cached_channels(self.NVR_IP, self.scan_parameters))
+
+    def test_load_is_cached_until_file_changes(self):
+        self.save_scan_result([1])
+        first_mapping = load_channel_mapping()
+        self.assertIs(first_mapping, load_channel_mapping())
+
+        mapping_file = get_path_to_channel_mapping()
+        with open(mapping_file, 'w') as f:
+            f.write('{}')
+        mtime_ns = os.stat(mapping_file).st_mtime_ns + 1000000000
+        os.utime(mapping_file, ns=(mtime_ns, mtime_ns))
+
+        self.assertEqual({}, load_channel_mapping())
+
+    def test_no_cached_channels_for_other_parameters(self):
+        self.save_scan_result([1])
+        other_parameters = dict(self.scan_parameters, content_type='jpg')
+
+        self.assertIsNone(get_cached_channels(self.NVR_IP, other_parameters))
+
+    def test_no_cached_channels_after_expiry(self):
+        self.save_scan_result([1], scanned_at=time.time() - CHANNEL_SCAN_CACHE_SECONDS - 1)
+
+        self.assertIsNone(get_cached_channels(self.NVR_IP, self.scan_parameters))
+
+    def test_no_cached_channels_for_interval_ending_after_scan(self):
+        time_interval = TimeInterval.from_string('2020-02-12 08:00:00', '2020-02-12 18:00:00')
+        self.scan_parameters = get_channel_scan_parameters(time_interval, 'mp4', 32)
+        scanned_at = datetime(2020, 2, 12, 12, 0, 0, tzinfo=timezone.utc).timestamp()
+
+        with mock.patch.object(media_download_all_channels.time, 'time', return_value=scanned_at + 60):
+            self.save_scan_result([1], scanned_at=scanned_at)
+
+            self.assertIsNone(get_cached_channels(self.NVR_IP, self.scan_parameters))
+
+    def test_failed_save_is_logged_and_keeps_previous_file(self):
+        self.save_scan_result([1])
+
+        with mock.patch.object(media_download_all_channels.os, 'replace', side_effect=OSError('Disk full')), \
+                self.assertLogs('hik_video_downloader', level='ERROR'):
+            self.save_scan_result([2])
+
+        self.assertEqual([1], get_cached_channels(self.NVR_IP, self.scan_parameters))
+        self.assertEqual(['channel_mapping.json'], os.listdir(self.temp_dir.name))
+
+
+if __name__ == '__main__':
+    unittest.main()
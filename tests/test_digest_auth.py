@@ -0,0 +1,90 @@
+import re
+import threading
+import unittest
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from src.camera_sdk import SharedChallengeDigestAuth
+
+
+class DigestStubServer(ThreadingHTTPServer):
+    """Accepts any digest answer for the current nonce and challenges everything else."""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), DigestStubHandler)
+        self.nonce = uuid.uuid4().hex
+        self.challenges_sent = 0
+        self.lock = threading.Lock()
+
+    def rotate_nonce(self):
+        with self.lock:
+            self.nonce = uuid.uuid4().hex
+
+
+class DigestStubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        authorization = self.headers.get('Authorization', '')
+        nonce_match = re.search(r'nonce="([^"]+)"', authorization)
+        with self.server.lock:
+            if authorization.startswith('Digest ') and nonce_match and nonce_match.group(1) == self.server.nonce:
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            self.server.challenges_sent += 1
+            stale = 'true' if nonce_match else 'false'
+            challenge = 'Digest realm="camera", qop="auth", nonce="{}", stale="{}"'.format(self.server.nonce, stale)
+        self.send_response(401)
+        self.send_header('WWW-Authenticate', challenge)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestSharedChallengeDigestAuth(unittest.TestCase):
+    def setUp(self):
+        self.server = DigestStubServer()
+        server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        server_thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.url = 'http://127.0.0.1:{}/ISAPI/System/time'.format(self.server.server_port)
+        self.auth = SharedChallengeDigestAuth('admin', 'password')
+        self.session = requests.Session()
+        self.addCleanup(self.session.close)
+
+    def get_in_new_thread(self):
+        answers = []
+        thread = threading.Thread(target=lambda: answers.append(self.session.get(self.url, auth=self.auth, timeout=5)))
+        thread.start()
+        thread.join()
+        return answers[0]
+
+    def test_new_thread_is_seeded_with_accepted_challenge(self):
+        self.assertEqual(200, self.session.get(self.url, auth=self.auth, timeout=5).status_code)
+        self.assertEqual(1, self.server.challenges_sent)
+
+        self.assertEqual(200, self.get_in_new_thread().status_code)
+        self.assertEqual(1, self.server.challenges_sent)
+
+    def test_stale_nonce_is_retried_once_and_shared(self):
+        self.assertEqual(200, self.session.get(self.url, auth=self.auth, timeout=5).status_code)
+        self.server.rotate_nonce()
+
+        self.assertEqual(200, self.session.get(self.url, auth=self.auth, timeout=5).status_code)
+        self.assertEqual(2, self.server.challenges_sent)
+
+        # A thread started after the rotation uses the new nonce right away
+        self.assertEqual(200, self.get_in_new_thread().status_code)
+        self.assertEqual(2, self.server.challenges_sent)
+
+
+if __name__ == '__main__':
+    unittest.main()
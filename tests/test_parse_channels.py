@@ -0,0 +1,78 @@
+import io
+import unittest
+from unittest import mock
+
+from media_download_all_channels import parse_channels, parse_parameters
+
+
+class TestParseChannels(unittest.TestCase):
+    def test_no_channels(self):
+        self.assertIsNone(parse_channels(None))
+        self.assertIsNone(parse_channels(''))
+
+    def test_single_channels(self):
+        self.assertEqual([1, 2, 3], parse_channels('3,1,2'))
+
+    def test_range(self):
+        self.assertEqual([1, 2, 3, 4], parse_channels('1-4'))
+
+    def test_range_with_spaces(self):
+        self.assertEqual([1, 2, 3, 4], parse_channels('1 - 4'))
+
+    def test_mixed_channels_and_ranges_without_duplicates(self):
+        self.assertEqual([1, 3, 4, 5, 6, 8], parse_channels('1,3-6,8, 5'))
+
+    def test_single_channel_range(self):
+        self.assertEqual([5], parse_channels('5-5'))
+
+    def test_channel_zero_is_rejected(self):
+        with self.assertRaises(ValueError):
+            parse_channels('0')
+        with self.assertRaises(ValueError):
+            parse_channels('0-3')
+
+    def test_descending_range_is_rejected(self):
+        with self.assertRaises(ValueError):
+            parse_channels('5-3')
+
+    def test_malformed_parts_are_rejected(self):
+        for channels_str in ('1-', '1--3', '-1', 'a', '1,,2', '1-2-3'):
+            with self.subTest(channels_str=channels_str), self.assertRaises(ValueError):
+                parse_channels(channels_str)
+
+
+class TestParseParameters(unittest.TestCase):
+    POSITIONAL_ARGUMENTS = ['10.10.10.10', '2020-02-12', '00:00:00', '2020-02-12', '06:00:00']
+
+    def parse(self, *options):
+        with mock.patch('sys.argv', ['media_download_all_channels.py', *options, *self.POSITIONAL_ARGUMENTS]):
+            return parse_parameters()
+
+    def test_channels_are_parsed(self):
+        parameters = self.parse('--channels', '1,3-4')
+
+        self.assertEqual([1, 3, 4], parameters.channels)
+
+    def test_channels_default_to_auto_detection(self):
+        self.assertIsNone(self.parse().channels)
+
+    def test_max_gap_defaults_to_full_scan(self):
+        self.assertEqual(0, self.parse().max_gap)
+        self.assertEqual(8, self.parse('--max-gap', '8').max_gap)
+
+    def test_negative_max_gap_is_reported_as_usage_error(self):
+        with mock.patch('sys.stderr', new_callable=io.StringIO), self.assertRaises(SystemExit) as context:
+            self.parse('--max-gap', '-1')
+
+        self.assertEqual(2, context.exception.code)
+
+    def test_invalid_channels_are_reported_as_usage_error(self):
+        with mock.patch('sys.stderr', new_callable=io.StringIO) as stderr, self.assertRaises(SystemExit) as context:
+            self.parse('--channels', '5-3')
+
+        self.assertEqual(2, context.exception.code)
+        self.assertIn('Invalid channel or channel range: "5-3"', stderr.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -34,6 +34,31 @@ class TestSecurityUtils(unittest.TestCase):
         malicious_path = '/etc/passwd'
         self.assertFalse(validate_path(malicious_path, base_path))
 
+    def test_validate_path_sibling_with_same_prefix(self):
+        """Test that a sibling directory sharing the base name prefix is rejected."""
+        base_path = os.path.join(self.test_dir, 'archive')
+        malicious_path = os.path.join(self.test_dir, 'archive-evil', 'file.txt')
+        self.assertFalse(validate_path(malicious_path, base_path))
+
+    def test_validate_path_base_itself(self):
+        """Test that the base directory itself is accepted."""
+        self.assertTrue(validate_path(self.test_dir, self.test_dir))
+
+    def test_validate_path_base_with_trailing_separator(self):
+        """Test that a base path ending with a separator is accepted."""
+        valid_path = os.path.join(self.test_dir, 'file.txt')
+        self.assertTrue(validate_path(valid_path, self.test_dir + os.sep))
+
+    def test_validate_path_relative_base(self):
+        """Test that a relative base path is resolved against the working directory."""
+        current_dir = os.getcwd()
+        os.chdir(self.test_dir)
+        try:
+            self.assertTrue(validate_path(os.path.join('media', 'file.txt'), 'media'))
+            self.assertFalse(validate_path(os.path.join('media-evil', 'file.txt'), 'media'))
+        finally:
+            os.chdir(current_dir)
+
     def test_sanitize_filename_removes_path_traversal(self):
         """Test that path traversal characters are removed."""
         malicious = '../../../etc/passwd'
@@ -83,6 +83,26 @@ class TestTimeInterval(unittest.TestCase):
 
         self.assertEqual(expected_interval, actual_interval)
 
+    def test_split_interval(self):
+        local_time_offset = timedelta(hours=3)
+        interval = TimeInterval.from_string('2020-02-12 00:00:00', '2020-02-12 06:00:00', local_time_offset)
+
+        expected_intervals = [
+            TimeInterval.from_string('2020-02-12 00:00:00', '2020-02-12 02:00:00'),
+            TimeInterval.from_string('2020-02-12 02:00:00', '2020-02-12 04:00:00'),
+            TimeInterval.from_string('2020-02-12 04:00:00', '2020-02-12 06:00:00'),
+        ]
+
+        actual_intervals = interval.split(3)
+        self.assertEqual(expected_intervals, actual_intervals)
+        for actual_interval in actual_intervals:
+            self.assertEqual(local_time_offset, actual_interval.local_time_offset)
+
+    def test_split_interval_into_one_part(self):
+        interval = TimeInterval.from_string('2020-02-12 00:00:00', '2020-02-12 06:00:00')
+
+        self.assertEqual([interval], interval.split(1))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,42 @@
+import threading
+import time
+import unittest
+
+from src.token_bucket import TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_up_to_capacity_is_not_delayed(self):
+        bucket = TokenBucket(rate=1, capacity=3)
+
+        start_time = time.monotonic()
+        for _ in range(3):
+            bucket.acquire()
+
+        self.assertLess(time.monotonic() - start_time, 0.5)
+
+    def test_acquire_waits_for_refill(self):
+        bucket = TokenBucket(rate=20)
+
+        start_time = time.monotonic()
+        for _ in range(3):
+            bucket.acquire()
+
+        # The first token is available at once, the next two take 1/20 s each
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.09)
+
+    def test_rate_is_shared_between_threads(self):
+        bucket = TokenBucket(rate=20)
+
+        start_time = time.monotonic()
+        threads = [threading.Thread(target=bucket.acquire) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.14)
+
+
+if __name__ == '__main__':
+    unittest.main()